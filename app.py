@@ -2,10 +2,19 @@ import streamlit as st
 import google.generativeai as genai
 from PIL import Image
 import json
+import os
+import re
+import math
+import sys
+import hmac
+import time
+import threading
+from collections import OrderedDict, deque
 import datetime
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
+import numpy as np
 import pytz
 import random
 
@@ -16,10 +25,49 @@ st.set_page_config(page_title="LifeLog", page_icon="🌱", layout="centered")
 def get_tr_now():
     return datetime.datetime.now(pytz.timezone('Europe/Istanbul'))
 
+# --- KULLANICILAR ---
+# secrets.toml:
+# [users.ali]
+# password = "..."
+# spreadsheet = "LifeLog_Ali"
+# service_account = "gcp_service_account"  (opsiyonel, secrets bölüm adı)
+# admin = true                              (opsiyonel)
+DEFAULT_USER = "default"
+USER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+def is_multi_user():
+    try: return "users" in st.secrets
+    except: return False
+
+def get_user_registry():
+    """Giriş yapabilen kullanıcılar. spreadsheet tanımlı olmayanlar dışarıda kalır (başkasının verisine düşmesin).
+    Kullanıcı adı dosya adlarında aynen kullanıldığı için [A-Za-z0-9_-]+ olmalı; "default" tek kullanıcı moduna ayrılmıştır."""
+    try: users = {uid: dict(cfg) for uid, cfg in st.secrets["users"].items()}
+    except: return {}
+    return {
+        uid: cfg for uid, cfg in users.items()
+        if cfg.get("spreadsheet") and USER_ID_PATTERN.fullmatch(uid) and uid != DEFAULT_USER
+    }
+
+def current_user():
+    if not is_multi_user():
+        return {"id": DEFAULT_USER, "spreadsheet": "LifeLog_DB", "service_account": "gcp_service_account", "admin": True}
+    uid = st.session_state.get("user_id")
+    cfg = get_user_registry().get(uid)
+    if cfg is None: raise PermissionError(f"Bilinmeyen kullanıcı: {uid}")
+    return {
+        "id": uid,
+        "spreadsheet": cfg["spreadsheet"],
+        "service_account": cfg.get("service_account", "gcp_service_account"),
+        "admin": bool(cfg.get("admin", False))
+    }
+
 # --- GÜVENLİK ---
 try:
     API_KEY = st.secrets["GOOGLE_API_KEY"]
-    gcp_secrets = st.secrets["gcp_service_account"]
+    # Sadece kullanıcıların gerçekten kullandığı servis hesapları zorunlu
+    service_accounts = {cfg.get("service_account", "gcp_service_account") for cfg in get_user_registry().values()}
+    for service_account in service_accounts or {"gcp_service_account"}: st.secrets[service_account]
 except:
     st.error("⚠️ Ayarlar eksik! Secrets kontrolü yap.")
     st.stop()
@@ -29,23 +77,141 @@ MODEL_ID = "gemini-2.5-flash"
 genai.configure(api_key=API_KEY)
 model = genai.GenerativeModel(MODEL_ID)
 
-# --- VERİTABANI BAĞLANTISI ---
+# --- KULLANICI HAVUZU (CACHE + METRİK) ---
+def get_cache_limits():
+    try: cfg = dict(st.secrets["cache"])
+    except: cfg = {}
+    return {
+        "user": int(cfg.get("user_limit_mb", 32)) * 1024 * 1024,
+        "total": int(cfg.get("total_limit_mb", 256)) * 1024 * 1024
+    }
+
 @st.cache_resource
-def get_google_sheet_client():
+def get_user_pool():
+    """Süreç genelinde tek havuz: kullanıcı başına cache alanı (LRU sıralı), kayıt boyutları ve metrikler."""
+    return {"lock": threading.Lock(), "caches": OrderedDict(), "sizes": {}, "metrics": {}}
+
+def _user_metrics(pool, uid):
+    return pool["metrics"].setdefault(uid, {
+        "reads": 0, "writes": 0, "errors": 0, "evictions": 0,
+        "latency_ms": deque(maxlen=200), "calls": deque(maxlen=500)
+    })
+
+def _estimate_size(obj):
+    # DataFrame.memory_usage sütun başına Series, Series.memory_usage tek int döner
+    if isinstance(obj, (pd.DataFrame, pd.Series)): return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, dict): return sum(_estimate_size(k) + _estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return sum(_estimate_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+def _evict_over_limit(pool, uid, keep_key, limits):
+    """Kilit altında çağrılır. Önce kullanıcının en eski kayıtlarını, sonra en eski kullanıcıları çıkarır."""
+    cache, sizes = pool["caches"][uid], pool["sizes"][uid]
+    for key in list(cache):
+        if sum(sizes.values()) <= limits["user"]: break
+        if key == keep_key: continue
+        del cache[key]; sizes.pop(key, None)
+        _user_metrics(pool, uid)["evictions"] += 1
+    total = sum(sum(v.values()) for v in pool["sizes"].values())
+    for other in list(pool["caches"]):
+        if total <= limits["total"]: break
+        if other == uid: continue
+        total -= sum(pool["sizes"].pop(other, {}).values())
+        del pool["caches"][other]
+        _user_metrics(pool, other)["evictions"] += 1
+
+def cache_get(key):
+    """Aktif kullanıcının cache kaydı (yoksa None). Erişim LRU sırasını günceller."""
+    pool, uid = get_user_pool(), current_user()["id"]
+    with pool["lock"]:
+        cache = pool["caches"].get(uid)
+        if cache is None or key not in cache: return None
+        pool["caches"].move_to_end(uid); cache.move_to_end(key)
+        return cache[key]
+
+def cache_put(key, value, size=None):
+    """Kaydı boyutuyla birlikte yazar; limitler sadece yazmada kontrol edilir."""
+    pool, uid, limits = get_user_pool(), current_user()["id"], get_cache_limits()
+    size = _estimate_size(value) if size is None else size
+    with pool["lock"]:
+        cache = pool["caches"].setdefault(uid, OrderedDict())
+        cache[key] = value
+        cache.move_to_end(key); pool["caches"].move_to_end(uid)
+        pool["sizes"].setdefault(uid, {})[key] = size
+        _evict_over_limit(pool, uid, key, limits)
+    return value
+
+def cache_resize(key, size=None):
+    """Yerinde güncellenen kaydın boyutunu yeniler."""
+    value = cache_get(key)
+    if value is not None: cache_put(key, value, size)
+
+def cache_pop(key):
+    pool, uid = get_user_pool(), current_user()["id"]
+    with pool["lock"]:
+        pool["caches"].get(uid, {}).pop(key, None)
+        pool["sizes"].get(uid, {}).pop(key, None)
+
+def record_call(kind, started, ok=True):
+    """kind: 'reads' / 'writes'. Sheets çağrısının süresini aktif kullanıcıya yazar."""
+    pool, uid = get_user_pool(), current_user()["id"]
+    with pool["lock"]:
+        m = _user_metrics(pool, uid)
+        m[kind] += 1
+        if not ok: m["errors"] += 1
+        m["latency_ms"].append((time.perf_counter() - started) * 1000)
+        m["calls"].append(time.time())
+
+def get_usage_metrics(uid=None):
+    pool, now = get_user_pool(), time.time()
+    rows = []
+    with pool["lock"]:
+        for user_id, m in pool["metrics"].items():
+            if uid and user_id != uid: continue
+            lat = sorted(m["latency_ms"])
+            cache_bytes = sum(pool["sizes"].get(user_id, {}).values())
+            rows.append({
+                "Kullanıcı": user_id, "Okuma": m["reads"], "Yazma": m["writes"], "Hata": m["errors"],
+                "İstek/dk": sum(1 for t in m["calls"] if t > now - 60),
+                "Ort. ms": round(sum(lat) / len(lat)) if lat else 0,
+                "p95 ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))]) if lat else 0,
+                "Cache MB": round(cache_bytes / 1024 / 1024, 2), "Tahliye": m["evictions"]
+            })
+    return rows
+
+# --- VERİTABANI BAĞLANTISI (HAVUZLU) ---
+@st.cache_resource
+def get_google_sheet_client(service_account="gcp_service_account"):
+    """Aynı servis hesabını kullanan tüm kullanıcılar tek client paylaşır."""
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(gcp_secrets, scope)
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets[service_account]), scope)
     client = gspread.authorize(creds)
     return client
 
+@st.cache_resource
+def get_spreadsheet(service_account, spreadsheet_name):
+    return get_google_sheet_client(service_account).open(spreadsheet_name)
+
+def get_worksheet(tab_name):
+    user = current_user()
+    return get_spreadsheet(user["service_account"], user["spreadsheet"]).worksheet(tab_name)
+
 # --- VERİ ÇEKME (CACHE YOK - CANLI) ---
-def get_all_sheet_data(tab_name):
-    """Belirtilen sekmedeki tüm veriyi ANLIK çeker."""
+def fetch_sheet_records(tab_name):
+    """get_all_sheet_data gibi, ama hata durumunda exception fırlatır (boş sekme != başarısız okuma)."""
+    started = time.perf_counter()
     try:
-        client = get_google_sheet_client()
-        sheet = client.open("LifeLog_DB").worksheet(tab_name)
-        return sheet.get_all_records()
+        records = get_worksheet(tab_name).get_all_records()
     except Exception as e:
-        return []
+        record_call("reads", started, ok=False)
+        raise
+    record_call("reads", started)
+    return records
+
+def get_all_sheet_data(tab_name):
+    """Belirtilen sekmedeki tüm veriyi ANLIK çeker."""
+    try: return fetch_sheet_records(tab_name)
+    except Exception as e: return []
 
 # --- YARDIMCI FONKSİYONLAR ---
 def get_settings():
@@ -63,16 +229,18 @@ def get_settings():
     except: return defaults
 
 def save_settings(new_settings):
+    started = time.perf_counter()
     try:
-        client = get_google_sheet_client()
-        sheet = client.open("LifeLog_DB").worksheet("Settings")
+        sheet = get_worksheet("Settings")
         sheet.clear()
         sheet.append_row(["Key", "Value"])
         for k, v in new_settings.items():
             value_to_save = v.strftime("%Y-%m-%d") if isinstance(v, datetime.date) else v
             sheet.append_row([k, value_to_save])
+        record_call("writes", started)
         return True
     except Exception as e:
+        record_call("writes", started, ok=False)
         st.error(f"Hata: {e}")
         return False
 
@@ -193,26 +361,358 @@ def get_gym_history(current_program):
         return history
     except: return {}
 
+# --- SİGARA ANALİZİ (GÜNLÜK CACHE) ---
+GUNLER = ["Pzt", "Sal", "Çar", "Per", "Cum", "Cmt", "Paz"]
+
+def get_smoke_analytics(day_key):
+    """Kullanıcı cache'inde gün başına bir kez hesaplanır. day_key: YYYY-MM-DD."""
+    cached = cache_get("smoke")
+    if cached and cached[0] == day_key: return cached[1]
+    try: s_data = fetch_sheet_records("SmokeLog")
+    except Exception as e:
+        # Okuma hatası cache'lenmez (gün boyu "kayıt yok" görünmesin), sonraki açılışta tekrar denenir
+        return dict(_empty_smoke_analytics(), error=True)
+    result = _compute_smoke_analytics(day_key, s_data)
+    cache_put("smoke", (day_key, result))
+    return result
+
+def _empty_smoke_analytics():
+    return {
+        "heatmap": pd.DataFrame(0, index=[f"{h:02d}:00" for h in range(24)], columns=GUNLER),
+        "triggers_7": pd.Series(dtype=float), "triggers_30": pd.Series(dtype=float),
+        "current_streak": 0, "best_streak": 0, "total": 0, "error": False
+    }
+
+def _compute_smoke_analytics(day_key, s_data):
+    """SmokeLog'u tek vektörel geçişte özetler. Bugünden sonraki tarihli satırlar hiçbir metriğe girmez."""
+    today = pd.Timestamp(day_key)
+    result = _empty_smoke_analytics()
+    if not s_data: return result
+    df = pd.DataFrame(s_data)
+    if "Tarih" not in df.columns or "Adet" not in df.columns: return result
+
+    # Tipli zaman indeksi + geçersiz ve ileri tarihli satırları at
+    ts = pd.DatetimeIndex(pd.to_datetime(df["Tarih"], errors='coerce'))
+    days_ago = (today - ts.normalize()).days.to_numpy()
+    valid = ~ts.isna() & (days_ago >= 0)
+    ts, days_ago = ts[valid], days_ago[valid].astype(int)
+    adet = pd.to_numeric(df["Adet"], errors='coerce').fillna(0).to_numpy()[valid]
+    neden = (df["Neden"].astype(str) if "Neden" in df.columns else pd.Series("Diğer", index=df.index)).to_numpy()[valid]
+    if len(ts) == 0: return result
+
+    # 1. Saat x Gün: tek bincount ile 24*7 kutu
+    bins = ts.hour.to_numpy() * 7 + ts.weekday.to_numpy()
+    grid = np.bincount(bins, weights=adet, minlength=24 * 7).reshape(24, 7)
+    result["heatmap"] = pd.DataFrame(grid.astype(int), index=result["heatmap"].index, columns=GUNLER)
+    result["total"] = int(adet.sum())
+
+    # 2. Neden payları (son 7 / 30 gün)
+    for window in (7, 30):
+        mask = days_ago < window
+        share = pd.Series(adet[mask]).groupby(neden[mask]).sum()
+        if share.sum() > 0: share = (share / share.sum() * 100).sort_values(ascending=False)
+        result[f"triggers_{window}"] = share
+
+    # 3. Sigarasız gün serileri (ilk kayıttan bugüne)
+    span = int(days_ago.max()) + 1
+    daily = np.bincount(days_ago, weights=adet, minlength=span)  # index 0 = bugün
+    smoked = daily > 0
+    result["current_streak"] = int(np.argmax(smoked)) if smoked.any() else span
+    free = (~smoked[::-1]).astype(int)
+    edges = np.diff(np.concatenate(([0], free, [0])))
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    result["best_streak"] = int(runs.max()) if runs.size else 0
+    return result
+
+# --- MEDYA ARAMA İNDEKSİ (YEREL) ---
+MEDIA_INDEX_DIR = os.path.dirname(os.path.abspath(__file__))
+TR_EKLER = sorted([
+    "ların", "lerin", "ları", "leri", "lar", "ler", "dan", "den", "tan", "ten",
+    "nın", "nin", "nun", "nün", "ın", "in", "un", "ün", "da", "de", "ta", "te",
+    "yı", "yi", "yu", "yü", "ı", "i", "u", "ü", "a", "e"
+], key=len, reverse=True)
+
+def tr_lower(text):
+    """Türkçe büyük/küçük harf katlama (İ->i, I->ı)."""
+    return str(text).replace("İ", "i").replace("I", "ı").lower()
+
+def tokenize_tr(text):
+    tokens = []
+    for word in re.findall(r"\w+", tr_lower(text)):
+        # Ekler art arda soyulur (kitaplardan -> kitaplar -> kitap), kök en az 3 harf kalır
+        stripped = True
+        while stripped:
+            stripped = False
+            for ek in TR_EKLER:
+                if word.endswith(ek) and len(word) - len(ek) >= 3:
+                    word = word[:-len(ek)]; stripped = True; break
+        tokens.append(word)
+    return tokens
+
+def _index_document(index, row):
+    """row: [tarih, tur, ad, cikarim, puan] -> doküman + posting listeleri."""
+    doc_id = str(len(index["docs"]))
+    doc = [str(v) for v in row[:5]]
+    index["docs"].append(doc)
+    # Yaklaşık bellek: metin + posting başına sabit maliyet (cache limiti için)
+    index["bytes"] = index.get("bytes", 0) + sum(len(v.encode("utf-8")) + 50 for v in doc)
+    for term in tokenize_tr(f"{row[2]} {row[3]}"):
+        postings = index["postings"].setdefault(term, {})
+        if doc_id not in postings: index["bytes"] += 100 + len(term)
+        postings[doc_id] = postings.get(doc_id, 0) + 1
+
+@st.cache_resource
+def get_media_index_lock():
+    """İndeks mutasyonu ve dosya yazımı için (aynı kullanıcının oturumları aynı indeksi paylaşır)."""
+    return threading.RLock()
+
+def media_index_path():
+    """Doküman başına bir JSON satırı; postingler yüklemede bellekte kurulur."""
+    uid = current_user()["id"]
+    name = "media_index.jsonl" if uid == DEFAULT_USER else f"media_index_{uid}.jsonl"  # uid kayıtta doğrulanır
+    return os.path.join(MEDIA_INDEX_DIR, name)
+
+def _new_media_index():
+    return {"docs": [], "postings": {}, "bytes": 0}
+
+def _write_media_file(docs):
+    """Tüm dosyayı atomik yazar (geçici dosya + os.replace)."""
+    path = media_index_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for doc in docs: f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def _append_media_file(doc):
+    try:
+        with open(media_index_path(), "a", encoding="utf-8") as f: f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+    except Exception as e:
+        # Dosya eksik kaldıysa sil: bir sonraki yüklemede sheet'ten yeniden kurulur
+        try: os.remove(media_index_path())
+        except OSError: pass
+
+def _read_media_file():
+    """Dosyadan indeks kurar; dosya yoksa None. Yarım kalmış satırlar atlanıp dosya düzeltilir."""
+    try:
+        with open(media_index_path(), encoding="utf-8") as f: lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    index, broken = _new_media_index(), False
+    for line in lines:
+        try: doc = json.loads(line)
+        except ValueError: broken = True; continue
+        _index_document(index, doc)
+    if broken: _write_media_file(index["docs"])
+    return index
+
+def rebuild_media_index():
+    """Sekmeyi bir kez indirip indeksi sıfırdan kurar. Okuma hatasında exception fırlatır, dosyaya dokunmaz."""
+    with get_media_index_lock():
+        index = _new_media_index()
+        for row in fetch_sheet_records("MediaLog"):
+            values = list(row.values())
+            if len(values) >= 5: _index_document(index, values)
+        _write_media_file(index["docs"])
+        cache_put("media_index", index, index["bytes"])
+    return index
+
+def _load_media_index():
+    """(index, yeniden_kuruldu) döner."""
+    with get_media_index_lock():
+        index = cache_get("media_index")
+        if index is not None: return index, False
+        index = _read_media_file()
+        if index is not None:
+            cache_put("media_index", index, index["bytes"])
+            return index, False
+        return rebuild_media_index(), True
+
+def get_media_index():
+    return _load_media_index()[0]
+
+def add_to_media_index(row):
+    """Satır sheet'e eklendikten SONRA çağrılır."""
+    try:
+        index, rebuilt = _load_media_index()
+    except Exception as e:
+        return  # İndeks kurulamadı: ilk erişimde sheet'ten (bu satır dahil) kurulacak
+    if rebuilt: return  # Yeni kurulan indeks bu satırı zaten içeriyor
+    with get_media_index_lock():
+        _index_document(index, row)
+        _append_media_file(index["docs"][-1])
+    cache_resize("media_index", index["bytes"])
+
+def search_media(query, turler=None, min_puan=1, limit=20):
+    """TF-IDF sıralı arama; Tür ve Puan filtreli."""
+    index = get_media_index()
+    scores = {}
+    with get_media_index_lock():
+        n_docs = len(index["docs"])
+        for term in set(tokenize_tr(query)):
+            postings = index["postings"].get(term, {})
+            if not postings: continue
+            idf = math.log(1 + n_docs / len(postings))
+            for doc_id, tf in postings.items():
+                scores[doc_id] = scores.get(doc_id, 0) + tf * idf
+
+    results = []
+    for doc_id, score in sorted(scores.items(), key=lambda x: x[1], reverse=True):
+        tarih, tur, ad, cikarim, puan = index["docs"][int(doc_id)]
+        try: puan_val = float(puan)
+        except: puan_val = None
+        if turler and tur not in turler: continue
+        # Puansız kayıtlar sadece filtre 1'in üstüne çıkarılınca elenir
+        if min_puan > 1 and (puan_val is None or puan_val < min_puan): continue
+        results.append({"Tarih": tarih, "Tür": tur, "Eser": ad, "Çıkarım": cikarim, "Puan": puan, "Skor": round(score, 2)})
+        if len(results) >= limit: break
+    return results
+
+# --- TREND MOTORU (ZAMAN İNDEKSLİ ORTAK DEPO) ---
+TREND_COLUMNS = {
+    "Weight": ["Tarih", "Kilo"],
+    "Nutrition": ["Tarih", "Yemek", "Kalori", "Protein", "Karb", "Yağ", "Kaynak"],
+    "Money": ["Tarih", "Tutar", "Kategori", "Ödeme", "Açıklama", "Dürtüsel"]
+}
+TREND_NUMERIC = {"Weight": ["Kilo"], "Nutrition": ["Kalori", "Protein", "Karb", "Yağ"], "Money": ["Tutar"]}
+TREND_TARGETS = {"Kalori": "target_cal", "Protein": "target_prot", "Karb": "target_karb", "Yağ": "target_yag"}
+EMA_ALPHA = 0.1
+
+def _to_daily(tab, df):
+    """Ham satırları günlük ön-agregasyona çevirir (Weight: son değer, diğerleri: toplam)."""
+    cols = [c for c in TREND_NUMERIC[tab] if c in df.columns]
+    if "Tarih" not in df.columns or not cols: return pd.DataFrame()
+    df = df.copy()
+    df["Tarih"] = pd.to_datetime(df["Tarih"], errors='coerce')
+    df = df.dropna(subset=["Tarih"]).sort_values(by="Tarih")
+    for c in cols: df[c] = pd.to_numeric(df[c], errors='coerce')
+    day = df["Tarih"].dt.normalize()
+    if tab == "Weight":
+        daily = df.groupby(day)[cols].last().dropna()
+    elif tab == "Money":
+        kategori = df["Kategori"].astype(str) if "Kategori" in df.columns else pd.Series("Diğer", index=df.index)
+        daily = df["Tutar"].fillna(0).groupby([day, kategori.rename("Kategori")]).sum().unstack(fill_value=0)
+    else:
+        daily = df[cols].fillna(0).groupby(day).sum()
+    daily.index.name = "Tarih"
+    return daily
+
+@st.cache_resource
+def get_trend_lock(uid):
+    """Kullanıcı başına kilit: aynı kullanıcının oturumları aynı trend deposunu paylaşır."""
+    return threading.RLock()
+
+def get_trend_store():
+    with get_trend_lock(current_user()["id"]):
+        store = cache_get("trends")
+        if store is None: store = cache_put("trends", {"daily": {}, "ema": pd.Series(dtype=float)})
+        return store
+
+def get_trend_daily(tab):
+    """Sekmenin günlük serisini döner; ilk başarılı okumada sheet'ten yüklenir.
+    Okuma hatası saklanmaz (boş seriye yeni satır eklenip yanlış trend oluşmasın), sonraki erişimde tekrar denenir."""
+    with get_trend_lock(current_user()["id"]):
+        store = get_trend_store()
+        if tab not in store["daily"]:
+            try: data = fetch_sheet_records(tab)
+            except Exception as e: return pd.DataFrame()
+            store["daily"][tab] = _to_daily(tab, pd.DataFrame(data)) if data else pd.DataFrame()
+            if tab == "Weight" and not store["daily"][tab].empty:
+                store["ema"] = store["daily"][tab]["Kilo"].ewm(alpha=EMA_ALPHA, adjust=False).mean()
+            cache_resize("trends")
+        return store["daily"][tab]
+
+def _update_weight_ema(store, new_days):
+    w, ema = store["daily"]["Weight"]["Kilo"], store["ema"]
+    if ema.empty or new_days.min() < ema.index.max():
+        # Geçmişe dönük kayıt: tam hesap
+        store["ema"] = w.ewm(alpha=EMA_ALPHA, adjust=False).mean()
+        return
+    for day in new_days:
+        if day == ema.index[-1]: base = ema.iloc[-2] if len(ema) > 1 else w[day]
+        else: base = ema.iloc[-1]
+        ema.loc[day] = EMA_ALPHA * w[day] + (1 - EMA_ALPHA) * base
+    store["ema"] = ema
+
+def update_trend_store(tab, rows):
+    """Yeni satırları sadece ilgili gün kovalarına ekler."""
+    if tab not in TREND_NUMERIC or not rows: return
+    width = min(len(TREND_COLUMNS[tab]), len(rows[0]))
+    new = _to_daily(tab, pd.DataFrame([list(r)[:width] for r in rows], columns=TREND_COLUMNS[tab][:width]))
+    if new.empty: return
+    with get_trend_lock(current_user()["id"]):
+        store = get_trend_store()
+        if tab not in store["daily"]: return
+        old = store["daily"][tab]
+        if old.empty: merged = new
+        elif tab == "Weight": merged = new.combine_first(old)
+        else: merged = old.add(new, fill_value=0).fillna(0)
+        store["daily"][tab] = merged.sort_index()
+        if tab == "Weight": _update_weight_ema(store, new.index)
+        cache_resize("trends")
+
+def get_weight_trend():
+    with get_trend_lock(current_user()["id"]):
+        daily = get_trend_daily("Weight")
+        if daily.empty: return pd.DataFrame()
+        return pd.DataFrame({"Kilo": daily["Kilo"], "Trend": get_trend_store()["ema"].copy()})
+
+def get_nutrition_averages():
+    """Son 7 ve 28 günün (kayıt olan günler) ortalamaları."""
+    daily = get_trend_daily("Nutrition")
+    today = pd.Timestamp(get_tr_now().date())
+    averages = {}
+    for window in (7, 28):
+        part = daily.loc[today - pd.Timedelta(days=window - 1):today] if not daily.empty else daily
+        averages[window] = part.mean() if not part.empty else pd.Series(dtype=float)
+    return averages
+
+def get_spend_by_period(freq):
+    """freq: 'W' haftalık, 'MS' aylık. Kategori bazında toplam."""
+    daily = get_trend_daily("Money")
+    if daily.empty: return daily
+    return daily.resample(freq).sum()
+
 # --- KAYIT FONKSİYONLARI ---
+def _after_write(tab_name, rows):
+    """Başarılı yazmadan sonra yerel indeks/trend güncellemesi. Hata olursa kayıt düşürülür, sonraki erişimde yeniden yüklenir."""
+    if tab_name == "MediaLog":
+        try:
+            for row in rows: add_to_media_index(row)
+        except Exception as e:
+            cache_pop("media_index")
+            try: os.remove(media_index_path())
+            except OSError: pass
+    try: update_trend_store(tab_name, rows)
+    except Exception as e:
+        with get_trend_lock(current_user()["id"]):
+            store = cache_get("trends")
+            if store is not None: store["daily"].pop(tab_name, None)
+
 def save_to_sheet(tab_name, row_data):
+    started = time.perf_counter()
     try:
-        client = get_google_sheet_client()
-        sheet = client.open("LifeLog_DB").worksheet(tab_name)
+        sheet = get_worksheet(tab_name)
         sheet.append_row(row_data)
-        return True
     except Exception as e:
+        record_call("writes", started, ok=False)
         st.error(f"Hata: {e}")
         return False
+    record_call("writes", started)
+    _after_write(tab_name, [row_data])
+    return True
 
 def save_batch_to_sheet(tab_name, rows_data):
+    started = time.perf_counter()
     try:
-        client = get_google_sheet_client()
-        sheet = client.open("LifeLog_DB").worksheet(tab_name)
+        sheet = get_worksheet(tab_name)
         sheet.append_rows(rows_data)
-        return True
     except Exception as e:
+        record_call("writes", started, ok=False)
         st.error(f"Hata: {e}")
         return False
+    record_call("writes", started)
+    _after_write(tab_name, rows_data)
+    return True
 
 # --- ANTRENMAN PROGRAMI ---
 ANTRENMAN_PROGRAMI = {
@@ -227,7 +727,11 @@ ANTRENMAN_PROGRAMI = {
 if "current_page" not in st.session_state: st.session_state.current_page = "home"
 if "ai_nutrition_result" not in st.session_state: st.session_state.ai_nutrition_result = None
 if "ai_text_result" not in st.session_state: st.session_state.ai_text_result = None
-if "user_settings" not in st.session_state: st.session_state.user_settings = get_settings()
+if "user_id" not in st.session_state: st.session_state.user_id = None if is_multi_user() else DEFAULT_USER
+# Secrets'tan silinen / geçersizleşen kullanıcının oturumu kapatılır
+if is_multi_user() and st.session_state.user_id not in get_user_registry():
+    st.session_state.user_id = None; st.session_state.pop("user_settings", None)
+if st.session_state.user_id and "user_settings" not in st.session_state: st.session_state.user_settings = get_settings()
 if "camera_active" not in st.session_state: st.session_state.camera_active = False
 
 def navigate_to(page):
@@ -239,6 +743,27 @@ def navigate_to(page):
 def open_camera(): st.session_state.camera_active = True; st.session_state.ai_nutrition_result = None 
 def close_camera(): st.session_state.camera_active = False
 
+def logout():
+    for key in list(st.session_state.keys()): del st.session_state[key]
+
+# ==========================================
+# 🔐 GİRİŞ
+# ==========================================
+def render_login():
+    st.title("🌱 LifeLog")
+    with st.container(border=True):
+        with st.form("login_form"):
+            username = st.text_input("Kullanıcı Adı")
+            password = st.text_input("Şifre", type="password")
+            if st.form_submit_button("Giriş", type="primary", use_container_width=True):
+                cfg = get_user_registry().get(username.strip()) or {}
+                stored = cfg.get("password")
+                # Şifresi tanımlı olmayan kullanıcı giriş yapamaz; bytes karşılaştırma Türkçe karakterleri destekler
+                if stored and hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8")):
+                    st.session_state.user_id = username.strip()
+                    st.rerun()
+                else: st.error("Kullanıcı adı veya şifre hatalı.")
+
 # ==========================================
 # 🏠 ANA MENÜ (DASHBOARD)
 # ==========================================
@@ -328,6 +853,7 @@ def render_media_log():
     st.button("⬅️ Geri Dön", on_click=navigate_to, args=("home",), type="secondary")
     st.title("📚 Film/Dizi/Kitap Takibi")
     st.caption("Ne izlediğini değil, ne öğrendiğini kaydet.")
+    st.button("🔎 Çıkarımlarda Ara", on_click=navigate_to, args=("media_search",), use_container_width=True, type="secondary")
     
     with st.container(border=True):
         with st.form("media_form"):
@@ -354,6 +880,41 @@ def render_media_log():
                             st.session_state.current_page = "home"
                             st.rerun()
 
+# ==========================================
+# 🔎 MEDYA ARAMA
+# ==========================================
+def render_media_search():
+    st.button("⬅️ Geri Dön", on_click=navigate_to, args=("media_log",), type="secondary")
+    st.title("🔎 Çıkarım Arama")
+
+    query = st.text_input("Ara", placeholder="Örn: alışkanlık, zaman yönetimi...")
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        turler = st.multiselect("Tür", ["Film", "Dizi", "Kitap", "Belgesel", "Podcast", "Makale"])
+    with col2:
+        min_puan = st.slider("Min. Puan", 1, 10, 1)
+
+    if query.strip():
+        try: results = search_media(query, turler, min_puan)
+        except Exception as e:
+            st.warning("İndeks şu an oluşturulamadı, daha sonra tekrar dene.")
+            results = None
+        if results:
+            st.caption(f"{len(results)} sonuç")
+            for r in results:
+                with st.container(border=True):
+                    st.markdown(f"**{r['Eser']}** <span style='color:grey; font-size:0.8rem;'>({r['Tür']} · {r['Puan'] or '-'}/10 · {r['Tarih']})</span>", unsafe_allow_html=True)
+                    st.write(r["Çıkarım"])
+        elif results is not None: st.info("Sonuç bulunamadı.")
+
+    st.divider()
+    if st.button("🔄 İndeksi Yeniden Oluştur", type="secondary", use_container_width=True):
+        with st.spinner("İndeks oluşturuluyor..."):
+            try:
+                index = rebuild_media_index()
+                st.success(f"✅ {len(index['docs'])} kayıt indekslendi.")
+            except Exception as e: st.error(f"Hata: {e}")
+
 # ==========================================
 # 🚀 PRODUCTIVITY MODÜLÜ
 # ==========================================
@@ -480,6 +1041,16 @@ def render_settings():
                         st.session_state.user_settings = new_settings
                         st.success("Ayarlar güncellendi! ✅")
 
+    user = current_user()
+    with st.expander("📈 Kullanım", expanded=False):
+        metrics = get_usage_metrics(None if user["admin"] else user["id"])
+        if metrics: st.dataframe(pd.DataFrame(metrics), use_container_width=True, hide_index=True)
+        else: st.caption("Henüz istek yok.")
+
+    if is_multi_user():
+        st.caption(f"Kullanıcı: {user['id']}")
+        st.button("🚪 Çıkış", on_click=logout, use_container_width=True, type="secondary")
+
 def render_weight():
     st.button("⬅️ Geri Dön", on_click=navigate_to, args=("home",), type="secondary")
     st.title("⚖️ Kilo Takibi")
@@ -493,6 +1064,12 @@ def render_weight():
         st.metric("Son Kayıtlı Kilo", f"{last_w} kg", f"{last_w_date}")
     else:
         st.info("Henüz kilo kaydı yok.")
+
+    trend = get_weight_trend()
+    if not trend.empty:
+        with st.container(border=True):
+            st.metric("Trend (EMA)", f"{trend['Trend'].iloc[-1]:.1f} kg")
+            st.line_chart(trend.tail(90))
     
     st.divider()
 
@@ -535,6 +1112,14 @@ def render_money():
                  st.dataframe(df_m[["Tarih", "Kategori", "Açıklama", "Tutar"]], use_container_width=True, hide_index=True)
             else: st.info("Veri formatı uygun değil.")
         else: st.info("Henüz harcama yok.")
+
+    with st.expander("📊 Kategori Trendi", expanded=False):
+        tab_w, tab_m = st.tabs(["Haftalık", "Aylık"])
+        for tab, freq, n in ((tab_w, "W", 12), (tab_m, "MS", 12)):
+            with tab:
+                spend = get_spend_by_period(freq)
+                if spend.empty: st.caption("Henüz harcama yok.")
+                else: st.bar_chart(spend.tail(n))
     
     st.divider()
 
@@ -564,6 +1149,7 @@ def render_smoke_log():
     st.button("⬅️ Geri Dön", on_click=navigate_to, args=("home",), type="secondary")
     st.title("🚬 Sigara Takibi")
     st.caption("Yargılama yok. Sadece veri topla.")
+    st.button("📊 Analiz", on_click=navigate_to, args=("smoke_stats",), use_container_width=True, type="secondary")
 
     with st.form("smoke_form"):
         col1, col2 = st.columns(2)
@@ -587,10 +1173,42 @@ def render_smoke_log():
             
             with st.spinner("Kaydediliyor..."):
                 if save_to_sheet("SmokeLog", veri):
+                    cache_pop("smoke")
                     st.toast(f"{adet} adet kaydedildi.", icon="🚬")
                     st.session_state.current_page = "home"
                     st.rerun()
 
+def render_smoke_stats():
+    st.button("⬅️ Geri Dön", on_click=navigate_to, args=("smoke_log",), type="secondary")
+    st.title("📊 Sigara Analizi")
+
+    with st.spinner("Hesaplanıyor..."):
+        a = get_smoke_analytics(get_tr_now().strftime("%Y-%m-%d"))
+
+    if a["error"]:
+        st.warning("Veri şu an alınamadı, daha sonra tekrar dene.")
+        return
+    if a["total"] == 0:
+        st.info("Henüz sigara kaydı yok.")
+        return
+
+    with st.container(border=True):
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Sigarasız Seri", f"{a['current_streak']} gün")
+        c2.metric("En Uzun Seri", f"{a['best_streak']} gün")
+        c3.metric("Toplam", f"{a['total']} adet")
+
+    st.subheader("🕒 Saat x Gün")
+    st.bar_chart(a["heatmap"].sum(axis=1))
+    st.dataframe(a["heatmap"], use_container_width=True)
+
+    st.subheader("🎯 Nedenler (%)")
+    tab7, tab30 = st.tabs(["Son 7 Gün", "Son 30 Gün"])
+    for tab, key in ((tab7, "triggers_7"), (tab30, "triggers_30")):
+        with tab:
+            if a[key].empty: st.caption("Bu aralıkta kayıt yok.")
+            else: st.bar_chart(a[key].round(1))
+
 # ... (render_nutrition aynı kalıyor)
 def render_nutrition():
     st.button("⬅️ Geri Dön", on_click=navigate_to, args=("home",), type="secondary")
@@ -609,6 +1227,26 @@ def render_nutrition():
         show_metric(col2, "Protein", stats.get('prot', 0), targets['target_prot'], "g")
         show_metric(col3, "Karb", stats.get('karb', 0), targets['target_karb'], "g")
         show_metric(col4, "Yağ", stats.get('yag', 0), targets['target_yag'], "g")
+
+    with st.expander("📈 7 / 28 Gün Ortalaması", expanded=False):
+        averages = get_nutrition_averages()
+        for window in (7, 28):
+            avg = averages[window]
+            if avg.empty:
+                st.caption(f"Son {window} günde kayıt yok.")
+                continue
+            st.markdown(f"**Son {window} Gün**")
+            cols = st.columns(4)
+            for col, name in zip(cols, TREND_TARGETS):
+                target = float(targets.get(TREND_TARGETS[name], 0))
+                value = float(avg.get(name, 0))
+                col.metric(name, f"{value:.0f}", f"{value - target:+.0f}", delta_color="off")
+        n_daily = get_trend_daily("Nutrition")
+        if not n_daily.empty and "Kalori" in n_daily.columns:
+            st.line_chart(pd.DataFrame({
+                "Kalori": n_daily["Kalori"],
+                "7G Ort.": n_daily["Kalori"].rolling("7D").mean()
+            }).tail(60))
     
     st.write("") 
 
@@ -728,12 +1366,15 @@ def render_nutrition():
 # ==========================================
 # ROUTER
 # ==========================================
-if st.session_state.current_page == "home": render_home()
+if not st.session_state.user_id: render_login()
+elif st.session_state.current_page == "home": render_home()
 elif st.session_state.current_page == "money": render_money()
 elif st.session_state.current_page == "nutrition": render_nutrition()
 elif st.session_state.current_page == "sport": render_sport()
 elif st.session_state.current_page == "weight": render_weight()
 elif st.session_state.current_page == "settings": render_settings()
 elif st.session_state.current_page == "smoke_log": render_smoke_log() # Yeni
+elif st.session_state.current_page == "smoke_stats": render_smoke_stats()
 elif st.session_state.current_page == "productivity": render_productivity()
 elif st.session_state.current_page == "media_log": render_media_log()
+elif st.session_state.current_page == "media_search": render_media_search()